@@ -5,7 +5,7 @@ Play with hdf files
 import h5py
 import numpy as np
 from PIL import Image
-from nexus2srs.nexus2srs_old import get_all_datasets, find_dataset
+import hdfmap
 import time
 
 # hdf = h5py.File('794932.nxs', 'r')
@@ -14,17 +14,22 @@ import time
 #hdf = h5py.File(r"\\data.diamond.ac.uk\i16\data\2022\cm31138-1\914860.nxs")
 hdf = h5py.File(r"C:\Users\grp66007\OneDrive - Diamond Light Source Ltd\I16\Nexus_Format\I10_nexus\example_I10_Nexus_Files\i10-608314.nxs")  # I10 scan
 
-address_datasets = get_all_datasets(hdf)
 
-array_addresses = [adr for adr, ds in address_datasets if ds.ndim > 1]
-t0 = time.time()
-for n in range(1000):
-    sfa = [adr for adr, ds in address_datasets if adr.endswith('/scan_fields')]
-t1 = time.time()
-print('address search: %s' % (t1 - t0))
+def bench(fn, n=1000):
+    """Return average time per call of fn() in ms, after one warm-up call"""
+    fn()
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - t0) / n / 1e6
 
-t0 = time.time()
-for n in range(1000):
-    sfa = find_dataset(hdf, 'scan_fields')
-t1 = time.time()
-print('find_dataset search: %s' % (t1 - t0))  # MUCH slower!
+
+hdf_map = hdfmap.NexusMap()
+hdf_map.populate(hdf)
+
+array_addresses = [adr for adr, ds in hdf_map.datasets.items() if len(ds.shape) > 1]
+t = bench(lambda: [adr for adr in hdf_map.datasets if adr.endswith('/scan_fields')])
+print('address search: %.4f ms/iter' % t)
+
+t = bench(lambda: hdf_map.get_path('scan_fields'))
+print('hdf_map lookup: %.4f ms/iter' % t)  # dict lookup, much faster
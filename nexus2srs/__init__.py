@@ -6,6 +6,12 @@ Usage (in python):
 >> from nexus2srs import nxs2dat
 >> nxs2dat('12345.nxs', '12345.dat', write_tiff=False)
 
+Convert a file that is already open:
+>> import hdfmap
+>> from nexus2srs import hdf2dat
+>> with hdfmap.load_hdf('12345.nxs') as hdf:
+>>     hdf2dat(hdf, '12345.dat')
+
 Usage (from terminal):
 $ nexus2srs 12345.nxs 12345.dat
 Include '-tiff' in arguments to save detector images as tif images.
@@ -23,6 +29,7 @@ Arguments
         /folder /new    convert all folder/*.nxs files to new/*.dat
         -tiff       Convert detector files to TIFF images
         -sync       Continuously synchronise folders
+        --jobs=N    Convert up to N files in parallel (default: number of CPUs)
         -h, --help  Display documentation
         --info      Set logging level to INFO
         --debug     Set logging level to DEBUG
@@ -33,11 +40,11 @@ Diamond Light Source Ltd.
 2023-2025
 """
 
-from nexus2srs.nexus2srs import __date__, __version__, set_logging_level, nxs2dat
+from nexus2srs.nexus2srs import __date__, __version__, set_logging_level, nxs2dat, hdf2dat
 from nexus2srs.cli import run_nexus2srs
 
 __all__ = [
-    'nxs2dat', 'run_nexus2srs', 'set_logging_level', 'version_info', 'module_info'
+    'nxs2dat', 'hdf2dat', 'run_nexus2srs', 'set_logging_level', 'version_info', 'module_info'
 ]
 
 
@@ -5,13 +5,17 @@ Command line program
 import sys
 import os
 import logging
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from time import sleep, ctime, time
 from hdfmap import list_files
 from nexus2srs import nxs2dat, set_logging_level
+from nexus2srs.nexus2srs import set_tiff_threads
 
 
 logger = logging.getLogger(__name__)
 DAT_SUBFOLDER = 'spool'  # DLS specific
+JOBS = os.cpu_count() or 1  # default number of parallel conversion processes in run_nexus2srs
 
 
 def doc():
@@ -29,14 +33,51 @@ def default_srs_folder(nexus_folder: str, srs_folder: str | None = None) -> str:
     return srs_folder
 
 
-def synchronise_files(nexus_folder, srs_folder=None, write_tiff=False, seconds_since_modified=300):
+def convert_file(nexus_file: str, dat_file: str | None = None, write_tiff: bool = False):
+    """Convert a single nexus file to dat file, printing the filename above the conversion output"""
+    print(f"\n----- {nexus_file} -----")
+    nxs2dat(nexus_file, dat_file, write_tiff)
+
+
+def init_worker(log_level: int, tiff_threads: int):
+    """Initialise a conversion process, with the parent logging level and its share of TIFF writing threads"""
+    set_logging_level(log_level)
+    set_tiff_threads(tiff_threads)
+
+
+def convert_files(nexus_files: list[str], dat_files: list[str | None], write_tiff: bool = False,
+                  jobs: int = 1) -> int:
+    """
+    Convert nexus files to dat files
+    Each conversion is independent, so with jobs > 1 multiple files are converted in parallel processes.
+    :param nexus_files: list of nexus filenames
+    :param dat_files: list of dat filenames or folders (or None), for each nexus file
+    :param write_tiff: if True, also write detector images as TIFF files
+    :param jobs: maximum number of parallel processes, 1 (default) converts files sequentially
+    :return: number of converted files
+    """
+    if jobs > 1 and len(nexus_files) > 1:
+        log_level = logging.getLogger(nxs2dat.__module__).level  # pass logging level to each process
+        workers = min(jobs, len(nexus_files))
+        tiff_threads = (os.cpu_count() or 1) // workers  # share CPUs between processes writing TIFFs
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(log_level, tiff_threads)) as executor:
+            list(executor.map(convert_file, nexus_files, dat_files, repeat(write_tiff)))
+    else:
+        for nxs_file, dat_file in zip(nexus_files, dat_files):
+            convert_file(nxs_file, dat_file, write_tiff)
+    return len(nexus_files)
+
+
+def synchronise_files(nexus_folder, srs_folder=None, write_tiff=False, seconds_since_modified=300, jobs=1):
     """Synchronise converted files between folders"""
     srs_folder = default_srs_folder(nexus_folder, srs_folder)
     nexus_files = list_files(nexus_folder)
     dat_files = list_files(srs_folder)
     logger.info(f"Synchronising {len(nexus_files)} .nxs files in {nexus_folder}\n" +
                 f" with {len(dat_files)} .dat files in {srs_folder}")
-    conversions = 0
+    new_nexus_files = []
+    new_dat_files = []
     for nxs_file in nexus_files:
         # check if file is still being written
         if os.path.getmtime(nxs_file) > time() - seconds_since_modified:
@@ -47,12 +88,12 @@ def synchronise_files(nexus_folder, srs_folder=None, write_tiff=False, seconds_s
             continue
         logger.info(f"Converting {nxs_file} to {dat_file}")
         print(f"Converting {nxs_file} to {dat_file}")
-        nxs2dat(nxs_file, dat_file, write_tiff)
-        conversions += 1
-    return conversions
+        new_nexus_files.append(nxs_file)
+        new_dat_files.append(dat_file)
+    return convert_files(new_nexus_files, new_dat_files, write_tiff, jobs)
 
 
-def continuous_sync(nexus_folder, srs_folder=None, write_tiff=False, pol_seconds=300):
+def continuous_sync(nexus_folder, srs_folder=None, write_tiff=False, pol_seconds=300, jobs=1):
     """Continuously monitor folders and synchronise nexus and dat files"""
     srs_folder = default_srs_folder(nexus_folder, srs_folder)
     print("Starting continuous sync of:")
@@ -60,7 +101,8 @@ def continuous_sync(nexus_folder, srs_folder=None, write_tiff=False, pol_seconds
     print(f"    to Dat files in: {srs_folder}")
     print(f"Checking folders every {pol_seconds}s")
     while True:
-        conversions = synchronise_files(nexus_folder, srs_folder, write_tiff, seconds_since_modified=pol_seconds)
+        conversions = synchronise_files(nexus_folder, srs_folder, write_tiff, seconds_since_modified=pol_seconds,
+                                        jobs=jobs)
         print(f"{ctime()}  converted {conversions} scans. Press Ctrl+C to exit.")
         sleep(pol_seconds)
 
@@ -78,6 +120,7 @@ def run_nexus2srs(*args):
         /folder /new    convert all folder/*.nxs files to new/*.dat
         -tiff       Convert detector files to TIFF images
         -sync       Continuously synchronise folders
+        --jobs=N    Convert up to N files in parallel (default: number of CPUs)
         -h, --help  Display documentation
         --info      Set logging level to INFO
         --debug     Set logging level to DEBUG
@@ -96,27 +139,40 @@ def run_nexus2srs(*args):
         set_logging_level('debug')
     if '--error' in args or '--quiet' in args:
         set_logging_level('error')
+    jobs = JOBS
+    for arg in args:
+        if arg.startswith('--jobs='):
+            value = arg[len('--jobs='):]
+            if not value.isdigit() or int(value) < 1:
+                print(f"Invalid argument '{arg}', --jobs=N requires a positive integer, e.g. --jobs=4")
+                return
+            jobs = int(value)
+    write_tiff = '-tiff' in args
+    sync = '-sync' in args
 
     tot = 0
+    nexus_files = []
+    dat_files = []
     look_for_dir = True
     for n, arg in enumerate(args):
         if arg.endswith('.nxs'):
-            tot += 1
             dat = args[n + 1] if len(args) > n + 1 and (
                     args[n + 1].endswith('.dat') or os.path.isdir(args[n + 1])
             ) else None
-            print(f"\n----- {arg} -----")
-            nxs2dat(arg, dat, '-tiff' in args)
+            nexus_files.append(arg)
+            dat_files.append(dat)
             look_for_dir = False
         elif look_for_dir and os.path.isdir(arg):
             srs_folder = args[n + 1] if len(args) > n + 1 and os.path.isdir(args[n + 1]) else None
-            if '-sync' in args:
-                continuous_sync(arg, srs_folder, '-tiff' in args)
+            if sync:
+                continuous_sync(arg, srs_folder, write_tiff, jobs=jobs)
                 break
             else:
-                tot = synchronise_files(arg, srs_folder, '-tiff' in args, 0)
+                tot = synchronise_files(arg, srs_folder, write_tiff, 0, jobs=jobs)
                 break
-    
+    if nexus_files:
+        tot = convert_files(nexus_files, dat_files, write_tiff, jobs)
+
     print('\nCompleted %d conversions' % tot)
 
 
@@ -8,14 +8,19 @@ Diamond Light Source Ltd.
 
 import sys
 import os
+import io
 import datetime
 import re
 import logging
 import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import h5py
 import numpy as np
 import hdfmap
+from PIL import Image
 
 __version__ = "1.1.0"
 __date__ = "2025/04/02"
@@ -36,7 +41,23 @@ NXDATA = 'data'
 NXATTR = 'local_name'  # 'gda_field_name'  # dataset attribute name
 
 PATH_TEMPLATE = '%05d.tif'
+SCANNABLES_FILE = 'scannables_file'  # metadata name of .npy file, when scannables are saved as binary
+SCAN_NUMBER_REGEX = re.compile(r'\d{4,}')  # scan number in filename, e.g. 'i16-12345.nxs'
+DEFAULT_DECIMALS = 8  # decimals used for scannables without a 'decimals' attribute
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+METADATA_CACHE_SIZE = 128 * 1024 * 1024  # bytes, HDF5 maximum metadata cache size
+WRITE_BUFFER_SIZE = 1024 * 1024  # bytes, buffer size of written .dat files
+TIFF_THREADS = os.cpu_count() or 1  # number of threads writing TIFF images
+TIFF_BLOCK_SIZE = 64 * 1024 * 1024  # bytes, maximum size of a block of detector frames read at once
+HDF_FILE_OPTIONS = {  # h5py.File options, the defaults of hdfmap.load_hdf, which updates its defaults in place
+    'swmr': True,
+    'libver': 'latest',
+}
+HDF_CACHE_OPTIONS = {  # h5py.File chunk cache options, for reading multi-MB detector chunks
+    'rdcc_nbytes': 64 * 1024 * 1024,  # bytes per dataset
+    'rdcc_nslots': 10007,  # prime, allocated on every dataset open, so kept small
+    'rdcc_w0': 0.75,
+}
 HEADER = """ &SRS
  SRSRUN=%s,SRSDAT=%s,SRSTIM=%s,
  SRSSTN='BASE',SRSPRJ='GDA_BASE',SRSEXP='Emulator',
@@ -67,11 +88,45 @@ def set_logging_level(level: str | int):
     logger.info(f"Logging level set to {level}")
 
 
+def set_tiff_threads(threads: int):
+    """
+    Set the number of threads writing TIFF images during each conversion
+    Parallel conversion processes should share the CPUs, rather than each using TIFF_THREADS=cpu_count.
+    :param threads: int number of threads, minimum 1
+    :return: None
+    """
+    global TIFF_THREADS
+    TIFF_THREADS = max(1, int(threads))
+    logger.debug(f"TIFF writing threads set to {TIFF_THREADS}")
+
+
+def set_metadata_cache(hdf_file: h5py.File, cache_size: int = METADATA_CACHE_SIZE):
+    """
+    Set a large, fixed HDF5 metadata cache on an open file
+    The default metadata cache starts at 2 MB and is adaptively resized, which causes repeated
+    evictions while walking NeXus files with many thousands of datasets and attributes.
+    As files are only read, the cache is fixed at cache_size and evictions are disabled.
+    :param hdf_file: h5py.File object
+    :param cache_size: int size of metadata cache in bytes
+    :return: None
+    """
+    config = hdf_file.id.get_mdc_config()
+    config.set_initial_size = True
+    config.initial_size = cache_size
+    config.min_size = min(config.min_size, cache_size)
+    config.max_size = max(config.max_size, cache_size)
+    config.incr_mode = 0  # H5C_incr__off
+    config.flash_incr_mode = 0  # H5C_flash_incr__off
+    config.decr_mode = 0  # H5C_decr__off
+    config.evictions_enabled = False
+    hdf_file.id.set_mdc_config(config)
+    logger.debug(f"Metadata cache size set to {cache_size} bytes")
+
+
 def write_image(image: np.ndarray, filename: str):
     """Write 2D array to TIFF image file"""
     if os.path.isfile(filename):
         return
-    from PIL import Image
     im = Image.fromarray(image)
     im.save(filename, "TIFF")
     logger.info('Written image to %s' % filename)
@@ -88,12 +143,29 @@ def nexus_scan_number(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> int:
         logger.debug(f"Scan number from {NXRUN}")
         return int(hdf_map.get_data(hdf_file, NXRUN))
     name = os.path.splitext(os.path.basename(hdf_file.filename))[0]
-    numbers = re.findall(r'\d{4,}', name)
+    numbers = SCAN_NUMBER_REGEX.findall(name)
     if numbers:
         return int(numbers[0])
     return 0
 
 
+def parse_date(date_str: str) -> datetime.datetime | None:
+    """
+    Parse date string using datetime.fromisoformat, falling back to DATE_FORMAT
+    The fallback parses NeXus timestamps that fromisoformat rejects on Python 3.10, e.g. a 'Z' offset.
+    :param date_str: str date, e.g. '2023-01-11T16:43:47.147+00:00'
+    :return: datetime object or None if the string can't be parsed
+    """
+    try:
+        return datetime.datetime.fromisoformat(date_str)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.strptime(date_str, DATE_FORMAT)
+    except ValueError:
+        return None
+
+
 def nexus_date(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> datetime.datetime:
     """
     Generate date of file, using either start_time or file creation date
@@ -103,25 +175,30 @@ def nexus_date(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> datetime.datetime
     """
     if NXDATE in hdf_map:
         date = hdf_map.get_data(hdf_file, NXDATE)
+        if isinstance(date, str):
+            date = parse_date(date)
         if isinstance(date, datetime.datetime):
             return date
     logger.warning(f"'{NXDATE}' not available or not datetime, using file creation time")
     return datetime.datetime.fromtimestamp(os.path.getctime(hdf_file.filename))
 
 
-def nexus_header(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> str:
+def nexus_header(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap, date: datetime.datetime | None = None) -> str:
     """
     Generate header from nexus file
     :param hdf_file: h5py.File object
     :param hdf_map: HdfMap object
+    :param date: datetime object from nexus_date, if already read (None reads date from file)
     :return: str
     """
     if NXSCANHEADER in hdf_map:
         logger.info(f"Getting header from '{NXSCANHEADER}'")
-        return '\n'.join(h for h in hdf_map.get_data(hdf_file, NXSCANHEADER))
+        # decode all lines in one read, np.ravel also allows a single scalar string
+        return '\n'.join(np.ravel(hdf_file[hdf_map[NXSCANHEADER]].asstr()[()]))
     else:
         logger.info('Generating header')
-        date = nexus_date(hdf_file, hdf_map)
+        if date is None:
+            date = nexus_date(hdf_file, hdf_map)
         srsrun = nexus_scan_number(hdf_file, hdf_map)
         srsdat = date.strftime('%Y%m%d')
         srstim = date.strftime('%H%M%S')
@@ -138,7 +215,7 @@ def nexus_detectors(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> (dict, dict)
     """
     metadata = {}
     detector_image_paths = {}  # only contains paths of array datasets, not image lists
-    used_image_datasets = []
+    used_image_datasets = set()  # h5py ObjectIDs hash on the underlying HDF object
     # Check for 'image_data' field (these files should exist already)
     if NXIMAGE in hdf_map:
         # image_data is an array of tif image names
@@ -159,7 +236,7 @@ def nexus_detectors(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> (dict, dict)
             logger.debug(f"'{name}_path_template': {template}")
             metadata[f"{name}_path_template"] = template
             detector_image_paths[name] = (hdf_map[NXIMAGE], template)  # not an image array!
-            used_image_datasets.append(image_data_dataset)
+            used_image_datasets.add(image_data_dataset.id)
         else:
             logger.warning(f"'{NXIMAGE}' available but failed to produce image_path")
 
@@ -167,28 +244,80 @@ def nexus_detectors(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> (dict, dict)
     filename, ext = os.path.splitext(os.path.basename(hdf_file.filename))
     for name, path in hdf_map.image_data.items():
         dataset = hdf_file[path]
-        if dataset in used_image_datasets:
+        if dataset.id in used_image_datasets:
             continue  # don't save the same images twice
         template = f"{filename}-{name}-files/{PATH_TEMPLATE}"
         logger.debug(f"'{name}_path_template': {template}")
         metadata[f"{name}_path_template"] = template
         detector_image_paths[name] = (path, template)
-        used_image_datasets.append(dataset)
+        used_image_datasets.add(dataset.id)
     return metadata, detector_image_paths
 
 
-def generate_datafile(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> (str, dict):
+def get_scannables_table(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> tuple[list[str], list[str], np.ndarray]:
     """
-    General purpose function to retrieve data from HDF files
+    Read numeric scannables from nexus file into a single 2D array
+    Each numeric scannable is read from the file in a single read, linked datasets are only read once.
     :param hdf_file: h5py.File object
     :param hdf_map: HdfMap object
-    :return: dat_string, {'detector_name': (path, template)}
+    :return: names, formats, table -> list of names, list of '%.{decimals}f' formats, array[scan_length, n_names]
+    """
+    arrays = {}  # {ObjectID: array}, ObjectIDs are equal for links to the same dataset
+    scannables = {}
+    for name, path in hdf_map.scannables.items():
+        dataset = hdf_file.get(path)
+        if not dataset or not np.issubdtype(dataset.dtype, np.number):
+            continue
+        if dataset.id not in arrays:
+            arrays[dataset.id] = np.ravel(dataset[()])  # one read per dataset, ravel avoids a copy
+        scannables[name] = arrays[dataset.id]
+    length = hdf_map.scannables_length()
+    formats = [
+        '%%.%df' % hdf_map.get_attr(hdf_map.scannables[name], 'decimals', default=DEFAULT_DECIMALS)
+        for name in scannables
+    ]
+    if scannables:
+        table = np.column_stack([array[:length] for array in scannables.values()])
+    else:
+        table = np.empty((0, 0))
+    return list(scannables), formats, table
+
+
+def write_scannables_table(file: io.TextIOBase, hdf_file: h5py.File, hdf_map: hdfmap.HdfMap,
+                           delimiter: str = ' ', binary_file: str | None = None):
+    """
+    Write table of scanned data from nexus file to an open text file
+    The first row gives the names of the scannables, each following row gives the values
+    at each scan point, formatted to the 'decimals' attribute of each dataset.
+    The table is formatted by numpy.savetxt on a single 2D array, rather than per-value in python.
+    If binary_file is given, only the names are written and the table is saved with numpy.save.
+    :param file: writable text file object
+    :param hdf_file: h5py.File object
+    :param hdf_map: HdfMap object
+    :param delimiter: str separator between each column
+    :param binary_file: str filename of .npy file to save the table in, or None to write table as text
+    :return: None
+    """
+    names, formats, table = get_scannables_table(hdf_file, hdf_map)
+    file.write(delimiter.join(names) + '\n')
+    if binary_file:
+        np.save(binary_file, table)
+        logger.info(f"Written scannables to: {binary_file}")
+    elif table.size:
+        np.savetxt(file, table, fmt=formats, delimiter=delimiter)
+
+
+def write_datafile(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap, file: io.TextIOBase,
+                   binary_file: str | None = None) -> dict:
+    """
+    Write SRS .dat file contents to an open text file
+    Each section is written as it is generated, so the whole file is never held in memory.
+    :param hdf_file: h5py.File object
+    :param hdf_map: HdfMap object
+    :param file: writable text file object
+    :param binary_file: str filename of .npy file to save the scannables table in, or None to write as text
+    :return: {'detector_name': (path, template)}
     """
-    logging.info(f"Generate datafile string from {repr(hdf_file)} using {repr(hdf_map)}")
-    # metadata
-    metadata_str = hdf_map.create_metadata_list(hdf_file)
-    # scandata
-    scannables_str = hdf_map.create_scannables_table(hdf_file, delimiter=' ')
     # Date
     date = nexus_date(hdf_file, hdf_map)
 
@@ -200,23 +329,42 @@ def generate_datafile(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> (str, dict
     # Detectors
     det_meta, detector_image_paths = nexus_detectors(hdf_file, hdf_map)
     req_meta.update(det_meta)
+    if binary_file:
+        req_meta[SCANNABLES_FILE] = os.path.basename(binary_file)
     # generate string
     required_metadata_str = '\n'.join(f"{name}='{value}'" for name, value in req_meta.items())
 
     # --- Header ---
-    header = nexus_header(hdf_file, hdf_map)
+    header = nexus_header(hdf_file, hdf_map, date)
+    # metadata
+    metadata_str = hdf_map.create_metadata_list(hdf_file)
 
-    # --- Build String ---
-    out = '\n'.join([
+    # --- Write sections ---
+    file.write('\n'.join([
         header,
         '<MetaDataAtStart>',
         required_metadata_str,
         metadata_str,
         '</MetaDataAtStart>',
         ' &END',
-        scannables_str,
-        ''  # blank line at end of file
-    ])
+        ''
+    ]))
+    # scandata
+    write_scannables_table(file, hdf_file, hdf_map, delimiter=' ', binary_file=binary_file)
+    return detector_image_paths
+
+
+def generate_datafile(hdf_file: h5py.File, hdf_map: hdfmap.HdfMap) -> (str, dict):
+    """
+    General purpose function to retrieve data from HDF files
+    :param hdf_file: h5py.File object
+    :param hdf_map: HdfMap object
+    :return: dat_string, {'detector_name': (path, template)}
+    """
+    logging.info(f"Generate datafile string from {repr(hdf_file)} using {repr(hdf_map)}")
+    out = io.StringIO()
+    detector_image_paths = write_datafile(hdf_file, hdf_map, out)
+    out = out.getvalue()
     logger.debug(f"Datafile string:\n\n{out}\n\n")
     return out, detector_image_paths
 
@@ -225,6 +373,7 @@ def write_tiffs(hdf: h5py.File, save_dir: str, detector_image_paths: dict):
     """
     Extract image frames from detectors and save as TIFF images
     If TIFF images exist already, they are copied to the new location.
+    Images are encoded and written to disk in parallel threads, while the next frames are read.
     :param hdf: h5py.File object
     :param save_dir: str name of directory to create image folder '{scan}-{detector}-files/'
     :param detector_image_paths: {'detector_name': ('path', 'template')}
@@ -232,33 +381,48 @@ def write_tiffs(hdf: h5py.File, save_dir: str, detector_image_paths: dict):
     """
 
     # --- write image data ---
-    for name, (hdf_path, template) in detector_image_paths.items():
-        logger.info(f'Detector images: {name}: {hdf_path}, template: {template}')
-        # Create image folder
-        det_folder = os.path.dirname(template)
-        det_dir = os.path.join(save_dir, det_folder)
-        im_file = os.path.join(save_dir, template)
-        if not os.path.isdir(det_dir):
-            os.makedirs(det_dir)
-            logger.info('Created folder: %s' % det_dir)
-        # Write TIFF images
-        data = hdf.get(hdf_path)
-        if data and isinstance(data, h5py.Dataset):
-            if not np.issubdtype(data, np.number):
-                # dataset is a list of TIF images - copy the files to the new location
-                for im, idx in enumerate(np.ndindex(data.shape)):
-                    data_dir = os.path.dirname(hdf.filename)
-                    old_file = os.path.join(data_dir, template % (im + 1))
-                    new_file = im_file % (im + 1)
-                    if os.path.isfile(old_file) and not os.path.isfile(new_file):
-                        logger.info(f"{idx} copying {old_file} to {new_file}")
-                        shutil.copy2(old_file, new_file)
-            elif data.ndim >= 3:
-                # Assume first index is the scan index
-                for im, idx in enumerate(np.ndindex(data.shape[:-2])):  # ndindex returns index iterator of each image
-                    image = data[idx]
-                    logger.info(f"{im_file % (im + 1)}, {idx}, {image.shape}")
-                    write_image(image, im_file % (im + 1))
+    with ThreadPoolExecutor(max_workers=TIFF_THREADS) as executor:
+        pending = deque()
+        for name, (hdf_path, template) in detector_image_paths.items():
+            logger.info(f'Detector images: {name}: {hdf_path}, template: {template}')
+            # Create image folder
+            det_folder = os.path.dirname(template)
+            det_dir = os.path.join(save_dir, det_folder)
+            im_file = os.path.join(save_dir, template)
+            if not os.path.isdir(det_dir):
+                os.makedirs(det_dir)
+                logger.info('Created folder: %s' % det_dir)
+            # Write TIFF images
+            data = hdf.get(hdf_path)
+            if data and isinstance(data, h5py.Dataset):
+                if not np.issubdtype(data, np.number):
+                    # dataset is a list of TIF images - copy the files to the new location
+                    for im, idx in enumerate(np.ndindex(data.shape)):
+                        data_dir = os.path.dirname(hdf.filename)
+                        old_file = os.path.join(data_dir, template % (im + 1))
+                        new_file = im_file % (im + 1)
+                        if os.path.isfile(old_file) and not os.path.isfile(new_file):
+                            logger.info(f"{idx} copying {old_file} to {new_file}")
+                            shutil.copy2(old_file, new_file)
+                elif data.ndim >= 3:
+                    # Assume first index is the scan index
+                    # Frames are read in blocks aligned to the dataset chunks, so each chunk is read and
+                    # decompressed once, rather than once for every frame it contains.
+                    # The block is limited to TIFF_BLOCK_SIZE, for datasets chunked along the whole scan.
+                    frame_size = int(np.prod(data.shape[-2:])) * data.dtype.itemsize
+                    block = min(data.chunks[-3], max(1, TIFF_BLOCK_SIZE // frame_size)) if data.chunks else 1
+                    im = 0
+                    for idx in np.ndindex(data.shape[:-3]):  # ndindex returns index iterator of each image stack
+                        for start in range(0, data.shape[-3], block):
+                            images = data[idx + (slice(start, start + block),)]
+                            for n, image in enumerate(images):
+                                im += 1
+                                logger.info(f"{im_file % im}, {idx + (start + n,)}, {image.shape}")
+                                pending.append(executor.submit(write_image, image, im_file % im))
+                                if len(pending) > 2 * TIFF_THREADS:
+                                    pending.popleft().result()  # limit the number of frames held in memory
+        for future in pending:
+            future.result()  # raises any errors from writing images
 
 
 "----------------------------------------------------------------------------"
@@ -266,38 +430,79 @@ def write_tiffs(hdf: h5py.File, save_dir: str, detector_image_paths: dict):
 "----------------------------------------------------------------------------"
 
 
-def nxs2dat(nexus_file: str, dat_file: str = None, write_tiff: bool = False):
+def hdf2dat(hdf: h5py.File, dat_file: str = None, write_tiff: bool = False, binary: bool = False):
     """
-    Load HDF file and convert to classic SRS .dat file
+    Convert an open HDF file to classic SRS .dat file
+    Allows the conversion of files that are already open, without re-opening the file.
 
-        nxs2dat('/mm12345-1/123456.nxs')  # generates 'mm12345-1/123456.dat'
-        nxs2dat('/mm12345-1/123456.nxs', write_tiff=True)  # generates 'mm12345-1/123456.dat' and tiff files in folder
-        nxs2dat('/mm12345-1/123456.nxs', '123456_new.dat')  # generates '123456_new.dat' in current folder
-        nxs2dat('/mm12345-1/123456.nxs', '/newdir')  # generates '/newdir/123456.dat'
+        with hdfmap.load_hdf('/mm12345-1/123456.nxs') as hdf:
+            hdf2dat(hdf)  # generates 'mm12345-1/123456.dat'
+            hdf2dat(hdf, '/newdir', write_tiff=True)  # generates '/newdir/123456.dat' and tiff files in folder
 
-    :param nexus_file: str filename of HDF/Nexus file
+    :param hdf: h5py.File object, open in read mode
     :param dat_file: str filename of ASCII file to create or folder to create in (None renames nexus file as *.dat)
     :param write_tiff: Bool, if True also writes any HDF images to TIF files in a folder
+    :param binary: Bool, if True the table of scanned data is saved in a *.npy file next to the .dat file
     :return: None
     """
+    nexus_file = hdf.filename
     if dat_file is None:
         dat_file = os.path.splitext(nexus_file)[0] + '.dat'
     elif os.path.isdir(dat_file):
         dat_file_name = os.path.splitext(os.path.basename(nexus_file))[0] + '.dat'
         dat_file = os.path.join(dat_file, dat_file_name)
+    binary_file = os.path.splitext(dat_file)[0] + '.npy' if binary else None
+
+    # --- index the file once, using the open file object ---
+    # only the default (or first) NXentry is walked, as an SRS file describes a single scan
+    nxs_map = hdfmap.NexusMap()
+    nxs_map.populate(hdf, default_entry_only=True)
+    if os.path.isfile(dat_file):
+        logger.warning(f"File already exists: {dat_file}")
+        _, detector_image_paths = nexus_detectors(hdf, nxs_map)
+    else:
+        # --- write scan data and header data from HDF, directly to file ---
+        # files are written in a temporary folder and only moved to dat_file once complete, so an error
+        # or interrupt (Ctrl+C) never leaves a partial file, which would be skipped on synchronisation
+        tmp_dir = tempfile.mkdtemp(prefix='.nexus2srs-', dir=os.path.dirname(dat_file) or '.')
+        try:
+            tmp_dat_file = os.path.join(tmp_dir, os.path.basename(dat_file))
+            tmp_binary_file = os.path.join(tmp_dir, os.path.basename(binary_file)) if binary_file else None
+            with open(tmp_dat_file, 'wt', buffering=WRITE_BUFFER_SIZE) as newfile:
+                detector_image_paths = write_datafile(hdf, nxs_map, newfile, tmp_binary_file)
+            if tmp_binary_file:
+                os.replace(tmp_binary_file, binary_file)
+            os.replace(tmp_dat_file, dat_file)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.info(f"Written to: {dat_file}")
+
+    if write_tiff:
+        write_tiffs(hdf, os.path.dirname(dat_file), detector_image_paths)
+
+
+def nxs2dat(nexus_file: str, dat_file: str = None, write_tiff: bool = False, binary: bool = False, **kwargs):
+    """
+    Load HDF file and convert to classic SRS .dat file
 
-    nxs_map = hdfmap.create_nexus_map(nexus_file)
-    logger.info('Nexus File: %s' % nexus_file)
-    with hdfmap.load_hdf(nexus_file) as hdf:
-        # --- get scan data and header data from HDF ---
-        outstr, detector_image_paths = generate_datafile(hdf, nxs_map)
-
-        if os.path.isfile(dat_file):
-            logger.warning(f"File already exists: {dat_file}")
-        else:
-            with open(dat_file, 'wt') as newfile:
-                newfile.write(outstr)
-            logger.info(f"Written to: {dat_file}")
+        nxs2dat('/mm12345-1/123456.nxs')  # generates 'mm12345-1/123456.dat'
+        nxs2dat('/mm12345-1/123456.nxs', write_tiff=True)  # generates 'mm12345-1/123456.dat' and tiff files in folder
+        nxs2dat('/mm12345-1/123456.nxs', '123456_new.dat')  # generates '123456_new.dat' in current folder
+        nxs2dat('/mm12345-1/123456.nxs', '/newdir')  # generates '/newdir/123456.dat'
+        nxs2dat('/mm12345-1/123456.nxs', binary=True)  # generates '123456.dat' and '123456.npy' with scan data
+        nxs2dat('/mm12345-1/123456.nxs', rdcc_nbytes=256*1024**2)  # use a larger chunk cache
+        nxs2dat('/mm12345-1/123456.nxs', driver='core', swmr=False)  # load whole file into memory
 
-        if write_tiff:
-            write_tiffs(hdf, os.path.dirname(dat_file), detector_image_paths)
+    :param nexus_file: str filename of HDF/Nexus file
+    :param dat_file: str filename of ASCII file to create or folder to create in (None renames nexus file as *.dat)
+    :param write_tiff: Bool, if True also writes any HDF images to TIF files in a folder
+    :param binary: Bool, if True the table of scanned data is saved in a *.npy file next to the .dat file
+    :param kwargs: additional h5py.File options, replacing HDF_FILE_OPTIONS and HDF_CACHE_OPTIONS
+        files are opened with swmr=True by default, so drivers that don't support SWMR also require swmr=False
+    :return: None
+    """
+    logger.info('Nexus File: %s' % nexus_file)
+    options = {**HDF_FILE_OPTIONS, **HDF_CACHE_OPTIONS, **kwargs}
+    with h5py.File(nexus_file, 'r', **options) as hdf:
+        set_metadata_cache(hdf)
+        hdf2dat(hdf, dat_file, write_tiff, binary)
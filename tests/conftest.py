@@ -0,0 +1,15 @@
+import pytest
+import os
+from nexus2srs import run_nexus2srs
+
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+FILE_NEW_NEXUS = os.path.join(DATA_FOLDER, '1040323.nxs')  # new nexus format
+
+
+@pytest.fixture(scope='session')
+def converted_nxs(tmp_path_factory):
+    """Convert FILE_NEW_NEXUS with TIFF images once per session, returns the output folder"""
+    out = tmp_path_factory.mktemp('nx2srs')
+    run_nexus2srs(FILE_NEW_NEXUS, str(out), '-tiff')
+    return out
@@ -1,52 +1,102 @@
 import pytest
 import os
 import shutil
-import subprocess
+import h5py
 from nexus2srs import run_nexus2srs, set_logging_level
+import nexus2srs.nexus2srs as nx2srs
+import nexus2srs.cli as cli
+from nexus2srs.cli import convert_files, init_worker
 
 
 DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
-FILE_NEW_NEXUS = os.path.join(DATA_FOLDER, '1040323.nxs')  # new nexus format
-NEW_FOLDER = os.path.join(DATA_FOLDER, 'test')
-SPOOL_FOLDER = os.path.join(DATA_FOLDER, 'spool')
 
 set_logging_level('info')
 
 
-def test_run_nexus2srs():
-    # Make folder /test
-    if os.path.isdir(NEW_FOLDER):
-        shutil.rmtree(NEW_FOLDER)
-    os.makedirs(NEW_FOLDER, exist_ok=True)
-    print(f"Create folder : {NEW_FOLDER} : {os.path.isdir(NEW_FOLDER)}")
-    command = f"python -m nexus2srs \"{FILE_NEW_NEXUS}\" \"{NEW_FOLDER}\" -tiff"
-    print('Running command:')
-    print(command)
-    output = subprocess.run(command, shell=True, capture_output=True)
-    print('\nOutput:')
-    print(output.stdout.decode())
-
-    assert os.path.exists(NEW_FOLDER + '/1040323.dat'), "file conversion not completed"
-    assert os.path.exists(NEW_FOLDER + '/1040323-pil3_100k-files/00021.tif'), "TIFF file writing incomplete"
-    # remove TIFF files
-    shutil.rmtree(NEW_FOLDER)
-
-
-def test_synchronise():
-    # Make folder /test
-    if os.path.isdir(SPOOL_FOLDER):
-        shutil.rmtree(SPOOL_FOLDER)
-    os.makedirs(SPOOL_FOLDER, exist_ok=True)
-    print(f"Create folder : {SPOOL_FOLDER} : {os.path.isdir(SPOOL_FOLDER)}")
-    command = f"python -m nexus2srs \"{DATA_FOLDER}\" --info"
-    print('Running command:')
-    print(command)
-    output = subprocess.run(command, shell=True, capture_output=True)
-    print('\nOutput:')
-    print(output.stdout.decode())
-
-    nexus_files = [file for file in os.listdir(DATA_FOLDER) if file.endswith('.nxs')]
-    dat_files = [file for file in os.listdir(SPOOL_FOLDER) if file.endswith('.dat')]
+def test_run_nexus2srs(converted_nxs):
+    # converted_nxs: run_nexus2srs(FILE_NEW_NEXUS, converted_nxs, '-tiff'), see conftest.py
+    assert os.path.exists(converted_nxs / '1040323.dat'), "file conversion not completed"
+    assert os.path.exists(converted_nxs / '1040323-pil3_100k-files/00021.tif'), "TIFF file writing incomplete"
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_convert_files(tmp_path, jobs):
+    nexus_files = [os.path.join(DATA_FOLDER, file) for file in ['1049598.nxs', '1054135.nxs']]
+    dat_files = [str(tmp_path / '1049598.dat'), str(tmp_path)]
+    assert convert_files(nexus_files, dat_files, jobs=jobs) == 2, "wrong number of conversions"
+    assert os.path.exists(tmp_path / '1049598.dat'), "file conversion not completed"
+    assert os.path.exists(tmp_path / '1054135.dat'), "file conversion not completed"
+
+
+def test_convert_files_default_sequential(tmp_path, monkeypatch):
+    def no_processes(*args, **kwargs):
+        raise AssertionError('process pool started by default')
+    monkeypatch.setattr(cli, 'ProcessPoolExecutor', no_processes)
+    nexus_files = [os.path.join(DATA_FOLDER, file) for file in ['1049598.nxs', '1054135.nxs']]
+    assert convert_files(nexus_files, [str(tmp_path)] * 2) == 2, "wrong number of conversions"
+
+
+def test_init_worker(monkeypatch):
+    monkeypatch.setattr(nx2srs, 'TIFF_THREADS', nx2srs.TIFF_THREADS)  # restored after test
+    init_worker(nx2srs.logger.level, 0)
+    assert nx2srs.TIFF_THREADS == 1, "TIFF threads not set to minimum"
+    init_worker(nx2srs.logger.level, 4)
+    assert nx2srs.TIFF_THREADS == 4, "TIFF threads not set"
+
+
+def test_convert_files_tiff(tmp_path):
+    nexus_files = [os.path.join(DATA_FOLDER, file) for file in ['1049598.nxs', 'i06-353130.nxs']]
+    assert convert_files(nexus_files, [str(tmp_path)] * 2, write_tiff=True, jobs=2) == 2
+    assert os.path.exists(tmp_path / 'i06-353130-medipix-files/00001.tif'), "TIFF file writing incomplete"
+
+
+def test_run_nexus2srs_sequential(tmp_path, capsys):
+    file1 = os.path.join(DATA_FOLDER, '1049598.nxs')
+    file2 = os.path.join(DATA_FOLDER, '1054135.nxs')
+    run_nexus2srs(file1, str(tmp_path), file2, str(tmp_path), '--jobs=1')
+    assert os.path.exists(tmp_path / '1049598.dat'), "file conversion not completed"
+    assert os.path.exists(tmp_path / '1054135.dat'), "file conversion not completed"
+    output = capsys.readouterr().out
+    assert output.index(f"----- {file1} -----") < output.index(f"----- {file2} -----"), "file headers missing"
+    assert 'Completed 2 conversions' in output
+
+
+@pytest.mark.parametrize('jobs', ['--jobs=auto', '--jobs=0', '--jobs='])
+def test_run_nexus2srs_invalid_jobs(tmp_path, capsys, jobs):
+    run_nexus2srs(os.path.join(DATA_FOLDER, '1054135.nxs'), str(tmp_path), jobs)
+    assert 'requires a positive integer' in capsys.readouterr().out, "usage error not printed"
+    assert not os.listdir(tmp_path), "files converted with invalid argument"
+
+
+def external_files(nexus_file: str) -> set[str]:
+    """Return the top-level files or folders, relative to nexus_file, referenced by its external links"""
+    files = set()
+
+    def visit(name, link):
+        if isinstance(link, h5py.ExternalLink) and not os.path.isabs(link.filename):
+            files.add(os.path.normpath(link.filename).split(os.sep)[0])
+    with h5py.File(nexus_file, 'r') as hdf:
+        hdf.visititems_links(visit)
+    return files
+
+
+def test_synchronise(tmp_path):
+    # copy nexus files and the detector files they reference into a temporary folder
+    names = set()
+    for name in os.listdir(DATA_FOLDER):
+        if name.endswith('.nxs'):
+            names.add(name)
+            names.update(external_files(os.path.join(DATA_FOLDER, name)))
+    for name in names:
+        source = os.path.join(DATA_FOLDER, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, tmp_path / name)
+        else:
+            shutil.copy2(source, tmp_path / name)
+    spool_folder = tmp_path / 'spool'
+    spool_folder.mkdir()
+    run_nexus2srs(str(tmp_path), '--info')
+
+    nexus_files = [file for file in os.listdir(tmp_path) if file.endswith('.nxs')]
+    dat_files = [file for file in os.listdir(spool_folder) if file.endswith('.dat')]
     assert len(nexus_files) == len(dat_files), 'not all files converted'
-    # remove TIFF files
-    shutil.rmtree(SPOOL_FOLDER)
@@ -1,12 +1,16 @@
 import pytest
 import os
-import shutil
-from nexus2srs import nxs2dat, set_logging_level
+import datetime
+import numpy as np
+import h5py
+from PIL import Image
+import hdfmap
+from nexus2srs import nxs2dat, hdf2dat, set_logging_level
+import nexus2srs.nexus2srs as nx2srs
 
 set_logging_level('info')
 
 DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
-FILE_NEW_NEXUS = DATA_FOLDER + '/1040323.nxs'  # new nexus format
 
 FILES = [
     '1040323.nxs',  # I16, new nexus, hkl scan, scan hkl
@@ -16,16 +20,12 @@ FILES = [
 ]
 
 
-def test_nxs2dat_new_nexus():
+def test_nxs2dat_new_nexus(tmp_path):
     nexus_file = DATA_FOLDER + '/' + FILES[0]
-    new_file = nexus_file.replace('.nxs', '.dat')
-    if os.path.exists(new_file):
-        os.remove(new_file)
-    nxs2dat(nexus_file, new_file, True)
+    nxs2dat(nexus_file, str(tmp_path), True)
+    new_file = tmp_path / '1040323.dat'
     assert os.path.exists(new_file), "file conversion not completed"
-    assert os.path.exists(DATA_FOLDER + '/1040323-pil3_100k-files/00021.tif'), "tif file writing imcomplete"
-    # remove tif files
-    shutil.rmtree(DATA_FOLDER + '/1040323-pil3_100k-files')
+    assert os.path.exists(tmp_path / '1040323-pil3_100k-files/00021.tif'), "tif file writing imcomplete"
     # Check dat file
     with open(new_file, 'r') as f:
         srs_text = f.read()
@@ -33,11 +33,9 @@ def test_nxs2dat_new_nexus():
     assert "pil3_100k_path_template='1040323-pil3_100k-files/%05d.tif'" in srs_text, "path template missing"
 
 
-def test_nxs2dat_old_nexus():
+def test_nxs2dat_old_nexus(tmp_path):
     nexus_file = DATA_FOLDER + '/' + FILES[1]
-    new_file = nexus_file.replace('.nxs', '.dat')
-    if os.path.exists(new_file):
-        os.remove(new_file)
+    new_file = str(tmp_path / FILES[1].replace('.nxs', '.dat'))
     nxs2dat(nexus_file, new_file, False)
     assert os.path.exists(new_file), "file conversion not completed"
     with open(new_file, 'r') as f:
@@ -46,11 +44,9 @@ def test_nxs2dat_old_nexus():
     assert "pil3_100k_path_template='1049598-pil3_100k-files/%05d.tif'" in srs_text, "path template missing"
 
 
-def test_nxs2dat_new_nexus2():
+def test_nxs2dat_new_nexus2(tmp_path):
     nexus_file = DATA_FOLDER + '/' + FILES[2]
-    new_file = nexus_file.replace('.nxs', '.dat')
-    if os.path.exists(new_file):
-        os.remove(new_file)
+    new_file = str(tmp_path / FILES[2].replace('.nxs', '.dat'))
     nxs2dat(nexus_file, new_file, False)
     assert os.path.exists(new_file), "file conversion not completed"
     with open(new_file, 'r') as f:
@@ -58,19 +54,164 @@ def test_nxs2dat_new_nexus2():
     assert srs_text.count('\n') == 219, "file conversion has wrong number of lines"
 
 
-def test_nxs2dat_3d_i06():
+def test_nxs2dat_3d_i06(tmp_path):
     nexus_file = DATA_FOLDER + '/' + FILES[3]
-    new_file = nexus_file.replace('.nxs', '.dat')
-    if os.path.exists(new_file):
-        os.remove(new_file)
+    new_file = str(tmp_path / FILES[3].replace('.nxs', '.dat'))
     nxs2dat(nexus_file, new_file, True)
     assert os.path.exists(new_file), "file conversion not completed"
-    assert os.path.exists(DATA_FOLDER + '/i06-353130-medipix-files/00001.tif'), "tif file writing incomplete"
-    # remove tif files
-    shutil.rmtree(DATA_FOLDER + '/i06-353130-medipix-files')
+    assert os.path.exists(tmp_path / 'i06-353130-medipix-files/00001.tif'), "tif file writing incomplete"
     # Check dat file
     with open(new_file, 'r') as f:
         srs_text = f.read()
     assert srs_text.count('\n') == 195, "file conversion has wrong number of lines"
     assert "medipix_path_template='i06-353130-medipix-files/%05d.tif'" in srs_text, "path template missing"
 
+
+def test_nxs2dat_binary(tmp_path):
+    nexus_file = DATA_FOLDER + '/' + FILES[2]
+    new_file = str(tmp_path / '1054135.dat')
+    npy_file = str(tmp_path / '1054135.npy')
+    nxs2dat(nexus_file, new_file, binary=True)
+    assert os.path.exists(new_file), "file conversion not completed"
+    assert os.path.exists(npy_file), "binary scannables file not written"
+    with open(new_file, 'r') as f:
+        srs_text = f.read()
+    assert "scannables_file='1054135.npy'" in srs_text, "binary file sentinel missing"
+    assert srs_text.endswith(' &END\n' + srs_text.splitlines()[-1] + '\n'), "scan table written in dat file"
+    table = np.load(npy_file)
+    assert table.shape == (11, 14), "binary scannables file has wrong shape"
+
+
+def test_hdf2dat(tmp_path):
+    nexus_file = DATA_FOLDER + '/' + FILES[1]
+    (tmp_path / 'hdf2dat').mkdir()
+    (tmp_path / 'nxs2dat').mkdir()
+    with hdfmap.load_hdf(nexus_file) as hdf:
+        hdf2dat(hdf, str(tmp_path / 'hdf2dat'))
+    nxs2dat(nexus_file, str(tmp_path / 'nxs2dat'))
+    hdf2dat_bytes = (tmp_path / 'hdf2dat' / '1049598.dat').read_bytes()
+    nxs2dat_bytes = (tmp_path / 'nxs2dat' / '1049598.dat').read_bytes()
+    assert hdf2dat_bytes == nxs2dat_bytes, "hdf2dat output differs from nxs2dat"
+
+
+def test_write_tiffs_block_size(tmp_path, monkeypatch):
+    # frames chunked along the whole scan, read in blocks limited by TIFF_BLOCK_SIZE
+    images = np.arange(20 * 8 * 8, dtype=np.float32).reshape(20, 8, 8)
+    monkeypatch.setattr(nx2srs, 'TIFF_BLOCK_SIZE', 3 * images[0].nbytes)
+    with h5py.File(tmp_path / 'images.h5', 'w') as hdf:
+        dataset = hdf.create_dataset('data', data=images, chunks=(20, 8, 8))
+        block_shapes = []
+        dataset_getitem = h5py.Dataset.__getitem__
+
+        def getitem(self, args, **kwargs):
+            out = dataset_getitem(self, args, **kwargs)
+            block_shapes.append(out.shape)
+            return out
+        monkeypatch.setattr(h5py.Dataset, '__getitem__', getitem)
+        nx2srs.write_tiffs(hdf, str(tmp_path), {'det': ('/data', 'images-det-files/%05d.tif')})
+    assert max(shape[0] for shape in block_shapes) == 3, "block of frames larger than TIFF_BLOCK_SIZE"
+    for n, image in enumerate(images):
+        with Image.open(tmp_path / f'images-det-files/{n + 1:05d}.tif') as im:
+            assert np.array_equal(np.asarray(im), image), "TIFF image differs from frame"
+
+
+def test_nxs2dat_hdf_file_options(tmp_path):
+    hdf_file_options = dict(hdfmap.hdf_loader.HDF_FILE_OPTIONS)
+    nxs2dat(DATA_FOLDER + '/' + FILES[2], str(tmp_path), rdcc_nbytes=32 * 1024 * 1024)
+    assert hdfmap.hdf_loader.HDF_FILE_OPTIONS == hdf_file_options, "hdfmap HDF_FILE_OPTIONS changed"
+    assert 'rdcc_nbytes' not in hdfmap.hdf_loader.HDF_FILE_OPTIONS, "chunk cache options added to hdfmap"
+
+
+def test_nxs2dat_hdf_file_kwargs(tmp_path):
+    nexus_file = DATA_FOLDER + '/' + FILES[2]
+    nxs2dat(nexus_file, str(tmp_path / 'cache.dat'), rdcc_nbytes=256 * 1024 * 1024, locking=False)
+    with hdfmap.load_hdf(nexus_file) as hdf:
+        rdcc_nbytes = hdf.id.get_access_plist().get_cache()[2]
+    assert rdcc_nbytes != 256 * 1024 * 1024, "nxs2dat kwargs used by later hdfmap.load_hdf"
+    assert 'locking' not in hdfmap.hdf_loader.HDF_FILE_OPTIONS, "nxs2dat kwargs added to hdfmap"
+    with pytest.raises(OSError):
+        nxs2dat(nexus_file, str(tmp_path / 'core.dat'), driver='core')  # driver requires swmr=False
+    assert 'driver' not in hdfmap.hdf_loader.HDF_FILE_OPTIONS, "nxs2dat kwargs added to hdfmap"
+    assert nx2srs.HDF_FILE_OPTIONS == {'swmr': True, 'libver': 'latest'}, "nxs2dat kwargs added to defaults"
+    nxs2dat(nexus_file, str(tmp_path / 'core.dat'), driver='core', swmr=False)
+    assert (tmp_path / 'core.dat').read_bytes() == (tmp_path / 'cache.dat').read_bytes(), "driver changed output"
+
+
+def test_parse_date():
+    # ISO format with offset
+    date = nx2srs.parse_date('2019-07-11T08:36:32.502+01:00')
+    assert date == datetime.datetime(2019, 7, 11, 8, 36, 32, 502000,
+                                     tzinfo=datetime.timezone(datetime.timedelta(hours=1)))
+    # 'Z' offset, parsed by DATE_FORMAT on Python 3.10
+    date = nx2srs.parse_date('2020-02-23T02:19:17.647Z')
+    assert date == datetime.datetime(2020, 2, 23, 2, 19, 17, 647000, tzinfo=datetime.timezone.utc)
+    date = datetime.datetime.strptime('2020-02-23T02:19:17.647Z', nx2srs.DATE_FORMAT)
+    assert date == datetime.datetime(2020, 2, 23, 2, 19, 17, 647000, tzinfo=datetime.timezone.utc)
+    assert nx2srs.parse_date('not a date') is None, "unparseable date should return None"
+
+
+@pytest.mark.parametrize('start_time, srsdat, srstim', [
+    ('2020-02-23T02:19:17.647Z', '20200223', '021917'),
+    ('not a date', None, None),  # falls back to file creation time
+])
+def test_nexus_date(tmp_path, start_time, srsdat, srstim):
+    nexus_file = str(tmp_path / 'date.nxs')
+    with h5py.File(nexus_file, 'w') as hdf:
+        hdf.attrs['default'] = 'entry'
+        entry = hdf.create_group('entry')
+        entry.attrs['NX_class'] = 'NXentry'
+        entry['start_time'] = start_time
+        data = entry.create_group('data')
+        data.attrs['NX_class'] = 'NXdata'
+        data.attrs['signal'] = 'x'
+        data['x'] = [1.0, 2.0]
+    if srsdat is None:
+        ctime = datetime.datetime.fromtimestamp(os.path.getctime(nexus_file))
+        srsdat, srstim = ctime.strftime('%Y%m%d'), ctime.strftime('%H%M%S')
+    with h5py.File(nexus_file, 'r') as hdf:
+        hdf_map = hdfmap.NexusMap()
+        hdf_map.populate(hdf, default_entry_only=True)
+        date = nx2srs.nexus_date(hdf, hdf_map)
+        header = nx2srs.nexus_header(hdf, hdf_map, date)
+    assert f"SRSDAT={srsdat},SRSTIM={srstim}," in header, "header has wrong date"
+
+
+def test_nxs2dat_multiple_entries(tmp_path):
+    # only the default NXentry is converted, metadata isn't taken from other entries
+    nexus_file = str(tmp_path / 'entries.nxs')
+    with h5py.File(nexus_file, 'w') as hdf:
+        hdf.attrs['default'] = 'entry1'
+        for n, name in enumerate(['entry1', 'entry2']):
+            entry = hdf.create_group(name)
+            entry.attrs['NX_class'] = 'NXentry'
+            entry['scan_command'] = f"scan x 1 3 1 {name}"
+            data = entry.create_group('measurement')
+            data.attrs['NX_class'] = 'NXdata'
+            data.attrs['signal'] = 'y'
+            data['x'] = [1.0, 2.0, 3.0]
+            data['y'] = [10.0, 20.0, 30.0 + n]
+    nxs2dat(nexus_file)
+    with open(tmp_path / 'entries.dat', 'r') as f:
+        srs_text = f.read()
+    assert "cmd='scan x 1 3 1 entry1'" in srs_text, "metadata not from default entry"
+    assert 'entry2' not in srs_text, "metadata from other entry"
+    assert srs_text.endswith('3.00000000 30.00000000\n'), "scannables not from default entry"
+
+
+def test_nxs2dat_missing_folder(tmp_path):
+    new_file = str(tmp_path / 'missing' / '1054135.dat')
+    with pytest.raises(FileNotFoundError) as excinfo:
+        nxs2dat(DATA_FOLDER + '/' + FILES[2], new_file)
+    assert excinfo.value.__context__ is None, "error opening file replaced by error in clean up"
+
+
+@pytest.mark.parametrize('error', [RuntimeError, KeyboardInterrupt])
+def test_nxs2dat_partial_files_removed(tmp_path, monkeypatch, error):
+    def failing_write(file, hdf_file, hdf_map, delimiter=' ', binary_file=None):
+        np.save(binary_file, np.zeros(3))
+        raise error('write failed')
+    monkeypatch.setattr(nx2srs, 'write_scannables_table', failing_write)
+    new_file = tmp_path / '1054135.dat'
+    with pytest.raises(error):
+        nxs2dat(DATA_FOLDER + '/' + FILES[2], str(new_file), binary=True)
+    assert not os.listdir(tmp_path), "partial files not removed"